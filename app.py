@@ -2,13 +2,18 @@
 Main application for the Databricks Genie Slack Bot.
 """
 import os
+import atexit
 import logging
+import queue
+from logging.handlers import QueueHandler, QueueListener
 from flask import Flask, request, jsonify
+from flask.json.provider import DefaultJSONProvider
+import orjson
 import hashlib
 import hmac
 import time
 
-from databricks_genie_bot.config import print_config_status, validate_config
+from databricks_genie_bot.config import CONFIG, print_config_status, validate_config
 from databricks_genie_bot.slack_bot import get_handler
 from databricks_genie_bot.databricks_utils import genie_query
 from dotenv import load_dotenv
@@ -18,14 +23,40 @@ dotenv_path = os.path.join(os.path.dirname(__file__), ".env")
 load_dotenv(dotenv_path=dotenv_path, override=True)
 
 # CONFIGURE LOGGING
+# Records are queued and written to stderr by a background listener thread,
+# so request threads never block on console I/O.
+_log_queue = queue.Queue(-1)
+_log_listener = QueueListener(_log_queue, logging.StreamHandler())
 logging.basicConfig(
-    level=logging.DEBUG,  # Change to DEBUG level
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    level=CONFIG.log_level,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
+    handlers=[QueueHandler(_log_queue)],
+    force=True,
 )
+_log_listener.start()
+atexit.register(_log_listener.stop)
 logger = logging.getLogger(__name__)
 
+# SIGNING SECRET, ENCODED ONCE FOR SIGNATURE VERIFICATION
+_SIGNING_SECRET = CONFIG.slack_signing_secret.encode("utf-8") if CONFIG.slack_signing_secret else None
+
+# KEYED HMAC STATE, COPIED PER REQUEST SO THE KEY SCHEDULE RUNS ONLY ONCE
+_HMAC_TEMPLATE = hmac.new(_SIGNING_SECRET, digestmod=hashlib.sha256) if _SIGNING_SECRET else None
+
+# ORJSON-BACKED JSON FOR request.json AND jsonify
+class OrjsonProvider(DefaultJSONProvider):
+    """Flask JSON provider that parses and serializes with orjson"""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, default=self.default).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 # INITIALIZE FLASK APP
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 
 # GET THE SLACK REQUEST HANDLER
 slack_handler = get_handler()
@@ -36,53 +67,78 @@ def test_integration():
     return jsonify(result)
 
 # SIGNATURE VERIFICATION
-def verify_slack_signature(request):
-    """Verify the request signature from Slack"""
-    slack_signing_secret = os.getenv("SLACK_SIGNING_SECRET")
-    
-    if not slack_signing_secret:
+def verify_slack_signature(headers, body: bytes) -> bool:
+    """Verify the request signature from Slack against the raw request body"""
+    if not _SIGNING_SECRET:
         logger.error("SLACK_SIGNING_SECRET is not set")
         return False
     
     # GET HEADERS
-    timestamp = request.headers.get("X-Slack-Request-Timestamp", "")
-    signature = request.headers.get("X-Slack-Signature", "")
+    timestamp = headers.get("X-Slack-Request-Timestamp", "")
+    signature = headers.get("X-Slack-Signature", "")
     
     if not timestamp or not signature:
         logger.error(f"Missing headers - Timestamp: {bool(timestamp)}, Signature: {bool(signature)}")
         return False
     
     # Check if timestamp is too old
-    if abs(time.time() - int(timestamp)) > 60 * 5:
+    try:
+        timestamp_bytes = timestamp.encode("ascii")
+        too_old = abs(time.time() - int(timestamp_bytes)) > 60 * 5
+    except ValueError:
+        logger.error("Malformed request timestamp")
+        return False
+    if too_old:
         logger.error("Request timestamp too old")
         return False
     
-    # Create base string (timestamp + : + request body)
-    req_data = request.get_data().decode("utf-8")
-    base_string = f"v0:{timestamp}:{req_data}"
+    # Decode Slack's "v0=<hex>" signature to raw digest bytes
+    if not signature.startswith("v0="):
+        logger.error("Unsupported signature version")
+        return False
+    try:
+        slack_digest = bytes.fromhex(signature[3:])
+    except ValueError:
+        logger.error("Malformed signature")
+        return False
+    if len(slack_digest) != _HMAC_TEMPLATE.digest_size:
+        logger.error("Signature has the wrong length")
+        return False
     
-    # Create our own signature
-    my_signature = "v0=" + hmac.new(
-        slack_signing_secret.encode("utf-8"),
-        base_string.encode("utf-8"),
-        hashlib.sha256
-    ).hexdigest()
+    # Sign the base string (v0 + : + timestamp + : + request body) part by part
+    h = _HMAC_TEMPLATE.copy()
+    h.update(b"v0:")
+    h.update(timestamp_bytes)
+    h.update(b":")
+    h.update(body)
     
-    # Compare signatures
-    is_valid = hmac.compare_digest(my_signature, signature)
+    # Compare raw digests
+    is_valid = hmac.compare_digest(h.digest(), slack_digest)
     if not is_valid:
         logger.error("Signature verification failed")
     return is_valid
 
 
 # SLACK EVENTS 
+_URL_VERIFICATION_MARKER = b'"type":"url_verification"'
+_MAX_CHALLENGE_BYTES = 1024
+
 @app.route("/slack/events", methods=["POST"])
 def slack_events():
     """Handle Slack events"""
-    logger.info("Received Slack event")
-    
     try:
-        data = request.json
+        # Verify the request comes from Slack before parsing the body
+        body = request.get_data()
+        if not verify_slack_signature(request.headers, body):
+            logger.error("Failed signature verification")
+            return jsonify({"error": "Invalid signature"}), 401
+        
+        # Answer URL verification challenges (tiny payloads) without logging the event
+        if len(body) <= _MAX_CHALLENGE_BYTES and _URL_VERIFICATION_MARKER in body:
+            return jsonify({"challenge": orjson.loads(body)["challenge"]})
+        
+        logger.info("Received Slack event")
+        data = orjson.loads(body)
         logger.info(f"Event type: {data.get('type')}")
         
         # Check if this is a verification challenge
@@ -90,11 +146,6 @@ def slack_events():
             logger.info("Handling verification challenge")
             return jsonify({"challenge": data["challenge"]})
         
-        # Verify the request comes from Slack
-        if not verify_slack_signature(request):
-            logger.error("Failed signature verification")
-            return jsonify({"error": "Invalid signature"}), 401
-        
         # For regular events, use the slack handler
         logger.info("Processing event with slack handler")
         return slack_handler.handle(request)
@@ -104,44 +155,53 @@ def slack_events():
         return jsonify({"error": str(e)}), 500
 
 # HEALTH CHECK
+_HEALTH_BODY = orjson.dumps({"status": "ok"})
+
 @app.route("/health", methods=["GET"])
 def health():
     """Health check endpoint"""
-    return jsonify({"status": "ok"})
+    return app.response_class(_HEALTH_BODY, mimetype="application/json")
+
+# HOME PAGE, ENCODED ONCE AT IMPORT
+_HOME_PAGE = """
+<html>
+    <head>
+        <title>Databricks Genie Slack Bot</title>
+        <style>
+            body { font-family: Arial, sans-serif; margin: 40px; line-height: 1.6; }
+            h1 { color: #333; }
+            .container { max-width: 800px; margin: 0 auto; }
+            .status { padding: 20px; background-color: #f5f5f5; border-radius: 5px; }
+            .info { margin-top: 20px; }
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <h1>Databricks Genie Slack Bot</h1>
+            <p>This is a Slack bot that integrates with Databricks Genie API to provide natural language querying capabilities.</p>
+            
+            <div class="status">
+                <h2>Status</h2>
+                <p>The bot is running and listening for Slack events at <code>/slack/events</code>.</p>
+            </div>
+            
+            <div class="info">
+                <h2>Usage</h2>
+                <p>In your configured Slack channel, simply type your data-related question, and the bot will process it through Databricks Genie.</p>
+            </div>
+        </div>
+    </body>
+</html>
+""".encode("utf-8")
 
 @app.route("/", methods=["GET"])
 def home():
     """Home page with basic info"""
-    return """
-    <html>
-        <head>
-            <title>Databricks Genie Slack Bot</title>
-            <style>
-                body { font-family: Arial, sans-serif; margin: 40px; line-height: 1.6; }
-                h1 { color: #333; }
-                .container { max-width: 800px; margin: 0 auto; }
-                .status { padding: 20px; background-color: #f5f5f5; border-radius: 5px; }
-                .info { margin-top: 20px; }
-            </style>
-        </head>
-        <body>
-            <div class="container">
-                <h1>Databricks Genie Slack Bot</h1>
-                <p>This is a Slack bot that integrates with Databricks Genie API to provide natural language querying capabilities.</p>
-                
-                <div class="status">
-                    <h2>Status</h2>
-                    <p>The bot is running and listening for Slack events at <code>/slack/events</code>.</p>
-                </div>
-                
-                <div class="info">
-                    <h2>Usage</h2>
-                    <p>In your configured Slack channel, simply type your data-related question, and the bot will process it through Databricks Genie.</p>
-                </div>
-            </div>
-        </body>
-    </html>
-    """
+    return app.response_class(
+        _HOME_PAGE,
+        mimetype="text/html",
+        headers={"Cache-Control": "public, max-age=3600"}
+    )
 
 @app.route("/api/query", methods=["POST"])
 def api_query():
@@ -167,17 +227,7 @@ def api_query():
 @app.route("/debug", methods=["GET"])
 def debug():
     """Debugging endpoint"""
-    load_dotenv()
-    
-    config_status = {
-        "slack_bot_token": bool(os.getenv("SLACK_BOT_TOKEN")),
-        "slack_channel_id": bool(os.getenv("SLACK_CHANNEL_ID")),
-        "slack_signing_secret": bool(os.getenv("SLACK_SIGNING_SECRET")),
-        "databricks_host": os.getenv("DATABRICKS_HOST"),
-        "databricks_token": bool(os.getenv("DATABRICKS_TOKEN")),
-        "space_id": bool(os.getenv("SPACE_ID"))
-    }
-    return jsonify(config_status)
+    return jsonify(CONFIG.debug_status())
 
 # Add a test endpoint to verify logging
 @app.route("/test-logging", methods=["GET"])
@@ -201,7 +251,7 @@ def main():
         # Get port from environment or use default
         port = int(os.getenv("PORT", 3000))
         
-        # Run the Flask app
+        # Run the Flask development server (start.sh runs gunicorn instead)
         app.run(host="0.0.0.0", port=port)
     
     except Exception as e:
@@ -2,6 +2,8 @@
 Configuration management for the Databricks Genie Slack Bot.
 """
 import os
+from dataclasses import dataclass
+from typing import Any, Dict, FrozenSet, Optional
 from dotenv import load_dotenv
 import logging
 
@@ -22,23 +24,107 @@ if os.path.exists(dotenv_path):
 else:
     logger.warning(f".env file not found at {dotenv_path}")
 
+# APPLICATION CONFIGURATION
+@dataclass(frozen=True)
+class AppConfig:
+    """Immutable snapshot of the bot configuration, resolved once at import"""
+
+    # Slack
+    slack_bot_token: Optional[str]
+    slack_signing_secret: Optional[str]
+    slack_channel_id: Optional[str]
+    # SLACK_CHANNEL_ID may list several comma-separated channels
+    slack_channel_ids: FrozenSet[str]
+
+    # Databricks
+    databricks_host: str
+    databricks_token: Optional[str]
+    space_id: Optional[str]
+    databricks_connect_timeout: float
+    databricks_read_timeout: float
+    # Fast-fail Databricks calls for breaker_reset_timeout seconds after
+    # breaker_fail_max consecutive timeouts, connection errors or 5xx responses
+    breaker_fail_max: int
+    breaker_reset_timeout: float
+
+    # Bot
+    maintain_context: bool
+    max_conversations: int
+    conversation_ttl: int
+    format_tables: bool
+    max_retries: int
+    log_level: str
+    # Exponential backoff between status polls: base, 2*base, 4*base, ... up to cap
+    retry_backoff_base: float
+    retry_backoff_cap: float
+
+    @classmethod
+    def from_env(cls) -> "AppConfig":
+        """Build the configuration from environment variables"""
+        return cls(
+            slack_bot_token=os.getenv("SLACK_BOT_TOKEN"),
+            slack_signing_secret=os.getenv("SLACK_SIGNING_SECRET"),
+            slack_channel_id=os.getenv("SLACK_CHANNEL_ID"),
+            slack_channel_ids=frozenset(
+                channel.strip() for channel in os.getenv("SLACK_CHANNEL_ID", "").split(",") if channel.strip()
+            ),
+            databricks_host=os.getenv("DATABRICKS_HOST", "https://dbc-dp-1234.cloud.databricks.com"),
+            databricks_token=os.getenv("DATABRICKS_TOKEN"),
+            space_id=os.getenv("SPACE_ID"),
+            databricks_connect_timeout=float(os.getenv("DATABRICKS_CONNECT_TIMEOUT", "3")),
+            databricks_read_timeout=float(os.getenv("DATABRICKS_READ_TIMEOUT", "30")),
+            breaker_fail_max=int(os.getenv("BREAKER_FAIL_MAX", "5")),
+            breaker_reset_timeout=float(os.getenv("BREAKER_RESET_TIMEOUT", "30")),
+            maintain_context=os.getenv("MAINTAIN_CONTEXT", "true").lower() == "true",
+            max_conversations=int(os.getenv("MAX_CONVERSATIONS", "10000")),
+            conversation_ttl=int(os.getenv("CONVERSATION_TTL", "3600")),
+            format_tables=os.getenv("FORMAT_TABLES", "true").lower() == "true",
+            max_retries=int(os.getenv("MAX_RETRIES", "15")),
+            log_level=os.getenv("LOG_LEVEL", "INFO").upper(),
+            retry_backoff_base=float(os.getenv("RETRY_BACKOFF_BASE", "0.25")),
+            retry_backoff_cap=float(os.getenv("RETRY_BACKOFF_CAP", "8")),
+        )
+
+    def debug_status(self) -> Dict[str, Any]:
+        """Return which settings are present, without exposing secrets"""
+        return {
+            "slack_bot_token": bool(self.slack_bot_token),
+            "slack_channel_id": bool(self.slack_channel_id),
+            "slack_signing_secret": bool(self.slack_signing_secret),
+            "databricks_host": self.databricks_host,
+            "databricks_token": bool(self.databricks_token),
+            "space_id": bool(self.space_id)
+        }
+
+
+CONFIG = AppConfig.from_env()
+logger.info(f"SLACK_BOT_TOKEN is {'set' if CONFIG.slack_bot_token else 'not set'}")
+logger.info(f"SLACK_SIGNING_SECRET is {'set' if CONFIG.slack_signing_secret else 'not set'}")
+
 # SLACK CONFIGURATION
-SLACK_BOT_TOKEN = os.getenv("SLACK_BOT_TOKEN")
-SLACK_SIGNING_SECRET = os.getenv("SLACK_SIGNING_SECRET")
-logger.info(f"SLACK_BOT_TOKEN is {'set' if SLACK_BOT_TOKEN else 'not set'}")
-logger.info(f"SLACK_SIGNING_SECRET is {'set' if SLACK_SIGNING_SECRET else 'not set'}")
-SLACK_CHANNEL_ID = os.getenv("SLACK_CHANNEL_ID")
+SLACK_BOT_TOKEN = CONFIG.slack_bot_token
+SLACK_SIGNING_SECRET = CONFIG.slack_signing_secret
+SLACK_CHANNEL_ID = CONFIG.slack_channel_id
+SLACK_CHANNEL_IDS = CONFIG.slack_channel_ids
 
 # DATABRICKS CONFIGURATION
-DATABRICKS_HOST = os.getenv("DATABRICKS_HOST", "https://dbc-dp-1234.cloud.databricks.com")
-DATABRICKS_TOKEN = os.getenv("DATABRICKS_TOKEN")
-SPACE_ID = os.getenv("SPACE_ID")
+DATABRICKS_HOST = CONFIG.databricks_host
+DATABRICKS_TOKEN = CONFIG.databricks_token
+SPACE_ID = CONFIG.space_id
+DATABRICKS_CONNECT_TIMEOUT = CONFIG.databricks_connect_timeout
+DATABRICKS_READ_TIMEOUT = CONFIG.databricks_read_timeout
+BREAKER_FAIL_MAX = CONFIG.breaker_fail_max
+BREAKER_RESET_TIMEOUT = CONFIG.breaker_reset_timeout
 
 # BOT CONFIGURATION
-MAINTAIN_CONTEXT = os.getenv("MAINTAIN_CONTEXT", "true").lower() == "true"
-FORMAT_TABLES = os.getenv("FORMAT_TABLES", "true").lower() == "true"
-MAX_RETRIES = int(os.getenv("MAX_RETRIES", "15"))
-RETRY_INTERVAL = int(os.getenv("RETRY_INTERVAL", "2"))
+MAINTAIN_CONTEXT = CONFIG.maintain_context
+MAX_CONVERSATIONS = CONFIG.max_conversations
+CONVERSATION_TTL = CONFIG.conversation_ttl
+FORMAT_TABLES = CONFIG.format_tables
+MAX_RETRIES = CONFIG.max_retries
+LOG_LEVEL = CONFIG.log_level
+RETRY_BACKOFF_BASE = CONFIG.retry_backoff_base
+RETRY_BACKOFF_CAP = CONFIG.retry_backoff_cap
 
 # VALIDATE CONFIGURATIONS
 def validate_config():
@@ -67,7 +153,11 @@ def print_config_status():
     print(f"  Databricks Host: {DATABRICKS_HOST}")
     print(f"  Databricks Token: {'✅ Set' if DATABRICKS_TOKEN else '❌ Missing'}")
     print(f"  Space ID: {'✅ Set' if SPACE_ID else '❌ Missing'}")
+    print(f"  Databricks Timeouts: connect {DATABRICKS_CONNECT_TIMEOUT}s, read {DATABRICKS_READ_TIMEOUT}s")
+    print(f"  Circuit Breaker: open after {BREAKER_FAIL_MAX} failures for {BREAKER_RESET_TIMEOUT}s")
     print(f"  Maintain Context: {MAINTAIN_CONTEXT}")
+    print(f"  Max Conversations: {MAX_CONVERSATIONS} (idle TTL {CONVERSATION_TTL} seconds)")
     print(f"  Format Tables: {FORMAT_TABLES}")
+    print(f"  Log Level: {LOG_LEVEL}")
     print(f"  Max Retries: {MAX_RETRIES}")
-    print(f"  Retry Interval: {RETRY_INTERVAL} seconds")
\ No newline at end of file
+    print(f"  Retry Backoff: {RETRY_BACKOFF_BASE}s doubling up to {RETRY_BACKOFF_CAP}s")
\ No newline at end of file
@@ -1,23 +1,140 @@
 """
 Utilities for interacting with the Databricks Genie API.
 """
-import json
+import logging
+import random
+import threading
 import time
+import ijson
+import orjson
 import requests
+import urllib3
+from requests.adapters import HTTPAdapter
 import pandas as pd
-from typing import Dict, List, Any, Optional, Tuple
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, List, Any, Callable, Optional, Tuple
 
 from databricks_genie_bot.config import (
     DATABRICKS_HOST,
     DATABRICKS_TOKEN,
     SPACE_ID,
+    DATABRICKS_CONNECT_TIMEOUT,
+    DATABRICKS_READ_TIMEOUT,
+    BREAKER_FAIL_MAX,
+    BREAKER_RESET_TIMEOUT,
     MAINTAIN_CONTEXT,
+    MAX_CONVERSATIONS,
+    CONVERSATION_TTL,
     MAX_RETRIES,
-    RETRY_INTERVAL,
+    RETRY_BACKOFF_BASE,
+    RETRY_BACKOFF_CAP,
 )
 
-# DICTIONARY TO STORE CONVERSATION CONTEXTS BY USER ID
-conversation_contexts = {}
+logger = logging.getLogger(__name__)
+
+# SHARED HTTP SESSION
+# Every poll hits the same host, so keep-alive connections save a TCP and TLS
+# handshake per request. Pool sizes cover one connection per concurrent query.
+_SESSION = requests.Session()
+_SESSION.mount("https://", HTTPAdapter(pool_connections=32, pool_maxsize=64))
+_SESSION.headers.update({"Content-Type": "application/json"})
+
+# (CONNECT, READ) TIMEOUTS IN SECONDS FOR EVERY DATABRICKS CALL
+_TIMEOUT = (DATABRICKS_CONNECT_TIMEOUT, DATABRICKS_READ_TIMEOUT)
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling Databricks while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Thread-safe consecutive-failure circuit breaker for Databricks calls"""
+
+    def __init__(self, fail_max: int = BREAKER_FAIL_MAX, reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        """Initialize a closed breaker"""
+        self.fail_max = fail_max
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at = None
+        self._lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError while open; let calls through once reset_timeout has passed"""
+        with self._lock:
+            if self._opened_at is not None and time.monotonic() - self._opened_at < self.reset_timeout:
+                raise CircuitOpenError(
+                    f"Databricks is unavailable after {self._failures} consecutive failures, try again shortly"
+                )
+
+    def record_success(self):
+        """Close the breaker"""
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+
+    def record_failure(self):
+        """Count a failure, (re)opening the breaker once fail_max is reached"""
+        with self._lock:
+            self._failures += 1
+            if self._failures >= self.fail_max:
+                if self._opened_at is None:
+                    logger.warning("Opening Databricks circuit breaker after %d consecutive failures", self._failures)
+                self._opened_at = time.monotonic()
+
+
+_BREAKER = CircuitBreaker()
+
+
+def _request(method: str, url: str, auth_token: str, **kwargs) -> requests.Response:
+    """Send a Databricks API request through the shared session and circuit breaker"""
+    _BREAKER.before_call()
+    try:
+        response = _SESSION.request(method, url, headers=_auth_headers(auth_token), timeout=_TIMEOUT, **kwargs)
+    except (requests.exceptions.Timeout, requests.exceptions.ConnectionError):
+        _BREAKER.record_failure()
+        raise
+    if response.status_code >= 500:
+        _BREAKER.record_failure()
+    elif not kwargs.get("stream"):
+        # A streamed body can still fail after the headers; _read_stream records the outcome
+        _BREAKER.record_success()
+    return response
+
+
+def _read_stream(response: requests.Response, parse: Callable[[Any], Dict]) -> Dict:
+    """Parse a streamed response body, counting a broken body against the circuit breaker"""
+    # Reading response.raw bypasses requests' exception wrapping, so map a
+    # stalled, reset or truncated body to the errors query_data retries on
+    try:
+        result = parse(response.raw)
+    except urllib3.exceptions.ReadTimeoutError as e:
+        _BREAKER.record_failure()
+        raise requests.exceptions.ConnectionError(e, response=response) from e
+    except (urllib3.exceptions.HTTPError, ijson.JSONError) as e:
+        _BREAKER.record_failure()
+        raise requests.exceptions.ChunkedEncodingError(e, response=response) from e
+    _BREAKER.record_success()
+    return result
+
+
+@lru_cache(maxsize=None)
+def _auth_headers(auth_token: str) -> Dict[str, str]:
+    """Return the (shared, read-only) Authorization header for a token"""
+    return {"Authorization": f"Bearer {auth_token}"}
+
+
+@lru_cache(maxsize=None)
+def _space_url(host: str, space_id: str) -> str:
+    """Return the Genie API base URL for a space"""
+    return f"{host}/api/2.0/genie/spaces/{space_id}"
+
+
+@lru_cache(maxsize=1024)
+def _message_url(host: str, space_id: str, conversation_id: str, message_id: str) -> str:
+    """Return the URL of a message, reused by every poll of that message"""
+    return f"{_space_url(host, space_id)}/conversations/{conversation_id}/messages/{message_id}"
 
 class ConversationContext:
     """Class to maintain conversation context with Databricks Genie"""
@@ -28,48 +145,82 @@ class ConversationContext:
         self.space_id = SPACE_ID
         self.auth_token = DATABRICKS_TOKEN
         self.host = DATABRICKS_HOST
+        # Serializes queries from the same user onto this conversation
+        self.lock = threading.Lock()
     
     def reset(self):
         """Reset the conversation context"""
         self.conversation_id = None
 
 
+class ConversationCache:
+    """Thread-safe LRU of conversation contexts by user ID, with idle expiry"""
+
+    def __init__(self, maxsize: int = MAX_CONVERSATIONS, ttl: float = CONVERSATION_TTL):
+        """Initialize an empty cache holding at most maxsize contexts"""
+        self.maxsize = maxsize
+        self.ttl = ttl
+        # user_id -> (context, last_used), least recently used first
+        self._contexts = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_create(self, user_id: str) -> ConversationContext:
+        """Return the user's context, creating a new one if missing or expired"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._contexts.pop(user_id, None)
+            if entry is None or now - entry[1] > self.ttl:
+                context = ConversationContext()
+            else:
+                context = entry[0]
+            self._contexts[user_id] = (context, now)
+
+            # Evict over-capacity and idle contexts from the least recently used end
+            while self._contexts:
+                _, (_, last_used) = next(iter(self._contexts.items()))
+                if len(self._contexts) <= self.maxsize and now - last_used <= self.ttl:
+                    break
+                self._contexts.popitem(last=False)
+            return context
+
+    def __len__(self) -> int:
+        return len(self._contexts)
+
+
+# CONVERSATION CONTEXTS BY USER ID
+conversation_contexts = ConversationCache()
+
+
 
 
 
 # SATRT A CONVERSATION AND PRINT DEBUG INFO
 def start_conversation(space_id: str, question: str, auth_token: str, host: str) -> Tuple[str, str]:
     """Start a new conversation with Databricks Genie"""
-    url = f"{host}/api/2.0/genie/spaces/{space_id}/start-conversation"
-    
-    headers = {
-        "Authorization": f"Bearer {auth_token}",
-        "Content-Type": "application/json"
-    }
+    url = f"{_space_url(host, space_id)}/start-conversation"
     
     data = {
         "content": question
     }
-    # Print debug information
-    print(f"Making request to: {url}")
-    print(f"Request headers: {headers}")
-    print(f"Request data: {data}")
+    logger.debug("Making request to: %s", url)
+    logger.debug("Request data: %s", data)
     
     try:
-        response = requests.post(url, headers=headers, json=data)
-        print(f"Response status: {response.status_code}")
-        print(f"Response content: {response.text}")
+        response = _request("POST", url, auth_token, data=orjson.dumps(data))
+        logger.debug("Response status: %s", response.status_code)
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Response content: %s", response.text)
         response.raise_for_status()
         
-        result = response.json()
+        result = orjson.loads(response.content)
         conversation_id = result["conversation_id"]
         message_id = result["message_id"]
     
         return conversation_id, message_id
     except requests.exceptions.RequestException as e:
-        print(f"Request error: {str(e)}")
+        logger.error("Request error: %s", e)
         if hasattr(e, 'response') and e.response is not None:
-            print(f"Error response: {e.response.text}")
+            logger.error("Error response: %s", e.response.text)
         raise
 
 
@@ -79,22 +230,18 @@ def start_conversation(space_id: str, question: str, auth_token: str, host: str)
 # ADD A MESSAGE TO A CONVERSATION (WHICH CONVERSATION??? NEED TO RETURN CONVERSATION ID)
 def add_message_to_conversation(space_id: str, conversation_id: str, question: str, auth_token: str, host: str) -> str:
     """Add a message to an existing conversation"""
-    url = f"{host}/api/2.0/genie/spaces/{space_id}/conversations/{conversation_id}/messages"
-    headers = {
-        "Authorization": f"Bearer {auth_token}",
-        "Content-Type": "application/json"
-    }
+    url = f"{_space_url(host, space_id)}/conversations/{conversation_id}/messages"
     data = {
         "content": question
     }
-    # Print debug information for add_message
-    print(f"Adding message - URL: {url}")
-    print(f"Request data: {data}")
-    response = requests.post(url, headers=headers, json=data)
-    print(f"Response status: {response.status_code}")
-    print(f"Response content: {response.text}")
+    logger.debug("Adding message - URL: %s", url)
+    logger.debug("Request data: %s", data)
+    response = _request("POST", url, auth_token, data=orjson.dumps(data))
+    logger.debug("Response status: %s", response.status_code)
+    if logger.isEnabledFor(logging.DEBUG):
+        logger.debug("Response content: %s", response.text)
     response.raise_for_status()
-    result = response.json()
+    result = orjson.loads(response.content)
     message_id = result["message_id"]
     return message_id
 
@@ -104,29 +251,58 @@ def add_message_to_conversation(space_id: str, conversation_id: str, question: s
 # GET QUERY MESSAGE
 def get_query_message(space_id: str, conversation_id: str, message_id: str, auth_token: str, host: str) -> Dict:
     """Get details of a message"""
-    url = f"{host}/api/2.0/genie/spaces/{space_id}/conversations/{conversation_id}/messages/{message_id}"
-    headers = {
-        "Authorization": f"Bearer {auth_token}",
-        "Content-Type": "application/json"
-    }
-    response = requests.get(url, headers=headers)
+    url = _message_url(host, space_id, conversation_id, message_id)
+    response = _request("GET", url, auth_token)
     response.raise_for_status()
-    return response.json()
+    return orjson.loads(response.content)
 
 
 
 
 # GET QUERY RESULTS
 def get_query_results(space_id: str, conversation_id: str, message_id: str, auth_token: str, host: str) -> Dict:
-    """Get query results for a message"""
-    url = f"{host}/api/2.0/genie/spaces/{space_id}/conversations/{conversation_id}/messages/{message_id}/query-result"
-    headers = {
-        "Authorization": f"Bearer {auth_token}",
-        "Content-Type": "application/json"
-    }
-    response = requests.get(url, headers=headers)
-    response.raise_for_status()
-    return response.json()
+    """Get query results for a message, with each data_typed_array row flattened to a list of cell strings"""
+    url = f"{_message_url(host, space_id, conversation_id, message_id)}/query-result"
+    with _request("GET", url, auth_token, stream=True) as response:
+        response.raise_for_status()
+        # Let urllib3 undo any gzip/deflate encoding while ijson reads the stream
+        response.raw.decode_content = True
+        return _read_stream(response, _parse_query_result_stream)
+
+
+# PREFIXES OF THE ROW EVENTS IN A STREAMED QUERY RESULT
+_ROWS_PREFIX = "statement_response.result.data_typed_array"
+_ROW_PREFIX = _ROWS_PREFIX + ".item"
+_ROW_VALUES_PREFIX = _ROW_PREFIX + ".values"
+_ROW_VALUE_PREFIX = _ROW_VALUES_PREFIX + ".item"
+_ROW_VALUE_STR_PREFIX = _ROW_VALUE_PREFIX + ".str"
+
+
+def _parse_query_result_stream(stream) -> Dict:
+    """Parse a query-result JSON stream, collecting rows without building a dict per cell"""
+    builder = ijson.ObjectBuilder()
+    rows = []
+    row = None
+    for prefix, event, value in ijson.parse(stream, use_float=True):
+        if not prefix.startswith(_ROW_PREFIX):
+            builder.event(event, value)
+        elif prefix == _ROW_PREFIX:
+            if event == "start_map":
+                row = None
+            elif event == "end_map" and row is not None:
+                rows.append(row)
+        elif prefix == _ROW_VALUES_PREFIX and event == "start_array":
+            row = []
+        elif prefix == _ROW_VALUE_PREFIX and event == "start_map":
+            row.append(None)
+        elif prefix == _ROW_VALUE_STR_PREFIX:
+            row[-1] = value
+
+    result = builder.value if isinstance(builder.value, dict) else {}
+    result_data = result.get("statement_response", {}).get("result")
+    if isinstance(result_data, dict) and "data_typed_array" in result_data:
+        result_data["data_typed_array"] = rows
+    return result
 
 
 
@@ -135,7 +311,7 @@ def get_query_results(space_id: str, conversation_id: str, message_id: str, auth
 ##EXPERI02
 def process_query_result(result: Dict) -> Optional[Dict[str, Any]]:
     """Process the query result and return formatted data"""
-    print(f"Processing query result: {result}")
+    logger.debug("Processing query result: %s", result)
 
     formatted_result = {
         "text": "",
@@ -172,13 +348,11 @@ def process_query_result(result: Dict) -> Optional[Dict[str, Any]]:
         if manifest and "schema" in manifest and "columns" in manifest["schema"]:
             formatted_result["columns"] = [field.get("name", "") for field in manifest["schema"]["columns"]]
         
-        # Extract rows of data
+        # Rows arrive already flattened to lists of cell strings by get_query_results
         if result_data and "data_typed_array" in result_data:
-            for row in result_data["data_typed_array"]:
-                if row and "values" in row:
-                    formatted_result["rows"].append([value.get("str", None) for value in row["values"]])
+            formatted_result["rows"] = result_data["data_typed_array"]
         
-        print(f"Extracted {len(formatted_result['rows'])} rows of data with {len(formatted_result['columns'])} columns")
+        logger.debug("Extracted %d rows of data with %d columns", len(formatted_result["rows"]), len(formatted_result["columns"]))
 
         # Format the results into a readable message
         if formatted_result["rows"] and formatted_result["columns"]:
@@ -197,13 +371,47 @@ def process_query_result(result: Dict) -> Optional[Dict[str, Any]]:
 
 
 
+# QUERY RESULT PREFETCH
+# Once Genie reports it is executing the SQL, the next poll fetches the query
+# result alongside the message status, so a completed query costs one round
+# trip instead of two. EXECUTING_QUERY can last for most of a long query, so
+# the prefetch is tried only once per message.
+_NEAR_READY_STATUSES = {"EXECUTING_QUERY"}
+_PREFETCH_EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix="genie-prefetch")
+
+
+def _prefetched_result(future: Optional[Future]) -> Optional[Dict]:
+    """Return a prefetched query result if it finished successfully, else None"""
+    if future is None:
+        return None
+    try:
+        result = future.result()
+    except Exception as e:
+        logger.debug("Prefetched query result unavailable: %s", e)
+        return None
+    if result.get("statement_response", {}).get("status", {}).get("state") != "SUCCEEDED":
+        return None
+    return result
+
+
+
+
+# BACKOFF DELAY BETWEEN STATUS POLLS
+def backoff_delay(attempt: int, base: float = RETRY_BACKOFF_BASE, cap: float = RETRY_BACKOFF_CAP) -> float:
+    """Exponential backoff with a little jitter: base * 2**attempt, capped at cap"""
+    return min(cap, base * 2 ** attempt) + random.uniform(0, 0.1)
+
+
+
+
 ####*******************************QUERY DATA EXPERITEST 00*************************####
 def query_data(space_id: str, question: str, auth_token: str, host: str, 
                conversation_id: Optional[str] = None, max_retries: int = MAX_RETRIES, 
-               retry_interval: int = RETRY_INTERVAL) -> Dict[str, Any]:
+               retry_base: float = RETRY_BACKOFF_BASE,
+               retry_cap: float = RETRY_BACKOFF_CAP) -> Dict[str, Any]:
     """Query Databricks with a question, handling conversation context"""
     try:
-        print(f"Starting query with max_retries={max_retries}, retry_interval={retry_interval}")
+        logger.debug("Starting query with max_retries=%s, retry_base=%s, retry_cap=%s", max_retries, retry_base, retry_cap)
         # Start a new conversation or add to existing one
         if conversation_id is None:
             conversation_id, message_id = start_conversation(space_id, question, auth_token, host)
@@ -211,19 +419,35 @@ def query_data(space_id: str, question: str, auth_token: str, host: str,
             message_id = add_message_to_conversation(space_id, conversation_id, question, auth_token, host)
 
         # Poll for results with retries
+        status = ""
+        prefetched = False
         for attempt in range(max_retries):
             try:
-                print(f"Attempt {attempt+1}/{max_retries}: Waiting {retry_interval} seconds before checking status")
-                time.sleep(retry_interval)
+                delay = backoff_delay(attempt, retry_base, retry_cap)
+                logger.debug("Attempt %d/%d: Waiting %.2f seconds before checking status", attempt + 1, max_retries, delay)
+                time.sleep(delay)
                 
-                print(f"Checking message status for conversation_id={conversation_id}, message_id={message_id}")
+                # Overlap the result fetch with the status check when the query is nearly done
+                prefetch = None
+                if status in _NEAR_READY_STATUSES and not prefetched:
+                    logger.debug("Prefetching query result while status is %s", status)
+                    prefetched = True
+                    prefetch = _PREFETCH_EXECUTOR.submit(
+                        get_query_results, space_id, conversation_id, message_id, auth_token, host
+                    )
+                
+                logger.debug("Checking message status for conversation_id=%s, message_id=%s", conversation_id, message_id)
                 message_data = get_query_message(space_id, conversation_id, message_id, auth_token, host)
-                print(f"Message data: {message_data}")
+                logger.debug("Message data: %s", message_data)
                 status = message_data.get("status", "")
-                print(f"Message status: {status}")
+                logger.debug("Message status: %s", status)
+                
+                # A result fetched before completion is stale; skip it if it hasn't started
+                if prefetch is not None and status not in ["COMPLETE", "COMPLETED"]:
+                    prefetch.cancel()
 
                 if status in ["COMPLETE", "COMPLETED"]:
-                    print(f"Query completed successfully (status: {status}), retrieving results")
+                    logger.debug("Query completed successfully (status: %s), retrieving results", status)
                     
                     # First check for text response in attachments
                     if "attachments" in message_data:
@@ -266,7 +490,9 @@ def query_data(space_id: str, question: str, auth_token: str, host: str,
                                     }
                                 
                                 # Get and process results for database queries
-                                result_data = get_query_results(space_id, conversation_id, message_id, auth_token, host)
+                                result_data = _prefetched_result(prefetch)
+                                if result_data is None:
+                                    result_data = get_query_results(space_id, conversation_id, message_id, auth_token, host)
                                 processed_result = process_query_result(result_data)
                                 
                                 if processed_result:
@@ -282,16 +508,16 @@ def query_data(space_id: str, question: str, auth_token: str, host: str,
                 # IF QUERY FAILED
                 if status == "ERROR":
                     error_message = message_data.get("error_message", "Unknown error occurred")
-                    print(f"Query failed with error: {error_message}")
+                    logger.error("Query failed with error: %s", error_message)
                     raise Exception(f"Query failed: {error_message}")               
                 # Check for results even if status is not 'COMPLETED' as the API might behave differently
                 if attempt > 3 and status in ["IN_PROGRESS", "PENDING", "RUNNING"]:
                     try:
-                        print(f"Attempting to get results even though status is {status}")
+                        logger.debug("Attempting to get results even though status is %s", status)
                         result_data = get_query_results(space_id, conversation_id, message_id, auth_token, host)  
                         # If we get here without an exception, process the results
                         processed_result = process_query_result(result_data)
-                        print(f"Got results despite status being {status}")
+                        logger.debug("Got results despite status being %s", status)
                         return {
                             "conversation_id": conversation_id,
                             "message_id": message_id,
@@ -299,16 +525,16 @@ def query_data(space_id: str, question: str, auth_token: str, host: str,
                             "note": f"Results retrieved while status was '{status}'"
                         }
                     except Exception as result_e:
-                        print(f"Could not get results while status is {status}: {str(result_e)}")
+                        logger.debug("Could not get results while status is %s: %s", status, result_e)
                 # Continue polling if still in progress
-                print(f"Query still in progress (status: {status}), continuing to poll")
+                logger.debug("Query still in progress (status: %s), continuing to poll", status)
             except requests.exceptions.RequestException as e:
                 # Handle transient API errors
-                print(f"Request exception on attempt {attempt+1}/{max_retries}: {str(e)}")
+                logger.warning("Request exception on attempt %d/%d: %s", attempt + 1, max_retries, e)
                 if attempt == max_retries - 1:
                     raise e       
         # If we've exhausted all retries
-        print(f"Query timed out after {max_retries} attempts with {retry_interval}s intervals")
+        logger.warning("Query timed out after %d attempts with backoff up to %ss", max_retries, retry_cap)
         raise Exception(f"Query timed out after {max_retries} attempts")       
     except Exception as e:
         # Handle any exceptions
@@ -334,25 +560,26 @@ def query_data(space_id: str, question: str, auth_token: str, host: str,
 def genie_query(user_id: str, question: str) -> Dict[str, Any]:
     """Query Databricks Genie, maintaining conversation context by user"""
     # Get or create conversation context for this user
-    if MAINTAIN_CONTEXT and user_id in conversation_contexts:
-        context = conversation_contexts[user_id]
+    if MAINTAIN_CONTEXT:
+        context = conversation_contexts.get_or_create(user_id)
     else:
         context = ConversationContext()
-        if MAINTAIN_CONTEXT:
-            conversation_contexts[user_id] = context
     
-    # Query data using the context
-    result = query_data(
-        space_id=context.space_id,
-        question=question,
-        auth_token=context.auth_token,
-        host=context.host,
-        conversation_id=context.conversation_id
-    )
-    
-    # Update the context with the new conversation ID if this is the first query
-    if context.conversation_id is None and "conversation_id" in result:
-        context.conversation_id = result["conversation_id"]
+    # Query data using the context, one question at a time per user so a burst
+    # of messages continues a single conversation instead of starting several
+    # (the Slack bot already queues each user's messages before they get here)
+    with context.lock:
+        result = query_data(
+            space_id=context.space_id,
+            question=question,
+            auth_token=context.auth_token,
+            host=context.host,
+            conversation_id=context.conversation_id
+        )
+        
+        # Update the context with the new conversation ID if this is the first query
+        if context.conversation_id is None and "conversation_id" in result:
+            context.conversation_id = result["conversation_id"]
     
     return result
 
@@ -1,20 +1,32 @@
 """
 Slack bot implementation for the Databricks Genie integration.
 """
+import csv
+import io
 import re
+import random
+import threading
+import time
 import logging
-from typing import Dict, List, Any, Callable
+from collections import OrderedDict, deque
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from functools import lru_cache
+from typing import Dict, List, Any, Callable, Tuple
 
 from slack_bolt import App
 from slack_bolt.adapter.flask import SlackRequestHandler
+from slack_sdk.errors import SlackApiError
 
-from databricks_genie_bot.config import SLACK_BOT_TOKEN, SLACK_CHANNEL_ID, SLACK_SIGNING_SECRET, FORMAT_TABLES
+from databricks_genie_bot.config import SLACK_BOT_TOKEN, SLACK_CHANNEL_ID, SLACK_CHANNEL_IDS, SLACK_SIGNING_SECRET, FORMAT_TABLES
 from databricks_genie_bot.databricks_utils import genie_query
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# MATCHES A USER/BOT MENTION AND ANY WHITESPACE AFTER IT
+_MENTION_RE = re.compile(r"<@[^>]+>\s*")
+
 # Initialize the Slack app with signing secret for verification if available
 if SLACK_SIGNING_SECRET and SLACK_BOT_TOKEN:
     app = App(
@@ -28,9 +40,211 @@ else:
         "SLACK_BOT_TOKEN and SLACK_SIGNING_SECRET must be set in environment variables"
     )
 
+# RATE LIMITING FOR chat.postMessage
+# Slack allows roughly one message per second per channel. A token bucket per
+# channel absorbs short bursts, and 429 responses are retried after Retry-After.
+_POST_RATE = 1.0  # tokens per second
+_POST_BURST = 3  # bucket capacity
+_POST_MAX_ATTEMPTS = 8
+
+
+class _ChannelRateLimiter:
+    """Thread-safe token bucket per Slack channel"""
+
+    def __init__(self, rate: float = _POST_RATE, burst: int = _POST_BURST):
+        """Initialize an empty set of full buckets"""
+        self.rate = rate
+        self.burst = burst
+        self._buckets = {}  # channel -> (tokens, last_refill)
+        self._lock = threading.Lock()
+
+    def acquire(self, channel: str):
+        """Take a token for the channel, sleeping until one is available"""
+        with self._lock:
+            now = time.monotonic()
+            tokens, last_refill = self._buckets.get(channel, (self.burst, now))
+            tokens = min(self.burst, tokens + (now - last_refill) * self.rate) - 1
+            self._buckets[channel] = (tokens, now)
+        # A negative balance reserves a future token; wait for it outside the lock
+        if tokens < 0:
+            time.sleep(-tokens / self.rate)
+
+
+_post_limiter = _ChannelRateLimiter()
+
+
+def _retry_after(error: SlackApiError) -> float:
+    """Return the Retry-After delay in seconds from a rate-limited response, if any"""
+    for name, value in (error.response.headers or {}).items():
+        if name.lower() == "retry-after":
+            value = value[0] if isinstance(value, list) else value
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return 0
+    return 0
+
+
+def _rate_limited_post(channel: str, **kwargs):
+    """Post a message through the per-channel rate limiter, retrying on HTTP 429"""
+    _post_limiter.acquire(channel)
+    for attempt in range(_POST_MAX_ATTEMPTS):
+        try:
+            return app.client.chat_postMessage(channel=channel, **kwargs)
+        except SlackApiError as e:
+            if e.response.status_code != 429 or attempt == _POST_MAX_ATTEMPTS - 1:
+                raise
+            delay = _retry_after(e) or min(2 ** attempt, 30)
+            delay += random.random()
+            logger.warning("Rate limited posting to %s, retrying in %.1fs", channel, delay)
+            time.sleep(delay)
+
+
+def _make_say(channel: str) -> Callable[[Dict[str, Any]], Any]:
+    """Return a say function that posts to the channel through the rate limiter"""
+    def say(msg_params):
+        return _rate_limited_post(channel, **msg_params)
+    return say
+
+# GENIE QUERY WORKERS AND DEFERRED "PROCESSING" ACKNOWLEDGEMENT
+# Genie queries run on a worker pool so event handlers return promptly.
+# Answers that arrive within _ACK_DELAY seconds are posted directly; slower
+# ones get a "processing" notice first and are posted when they finish.
+_ACK_DELAY = 1.5
+_QUERY_EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix="genie-query")
+
+# PER-USER QUERY QUEUES
+# Each user's questions run one after another on a single worker, so a burst
+# from one user takes one worker instead of filling the pool while other
+# users wait. user_id -> pending (future, fn, args); present while draining.
+_user_queues: Dict[str, deque] = {}
+_user_queues_lock = threading.Lock()
+
+
+def _submit_for_user(user_id: str, fn: Callable, *args) -> Future:
+    """Queue fn(*args) behind the user's earlier queries and return its Future"""
+    future = Future()
+    with _user_queues_lock:
+        pending = _user_queues.get(user_id)
+        if pending is not None:
+            pending.append((future, fn, args))
+            return future
+        _user_queues[user_id] = deque([(future, fn, args)])
+    _QUERY_EXECUTOR.submit(_drain_user_queue, user_id)
+    return future
+
+
+def _drain_user_queue(user_id: str):
+    """Run the user's queued queries in order until the queue is empty"""
+    while True:
+        with _user_queues_lock:
+            pending = _user_queues[user_id]
+            if not pending:
+                del _user_queues[user_id]
+                return
+            future, fn, args = pending.popleft()
+        if not future.set_running_or_notify_cancel():
+            continue
+        try:
+            future.set_result(fn(*args))
+        except BaseException as e:
+            future.set_exception(e)
+
+# RECENTLY HANDLED MESSAGES
+# A message that @mentions the bot arrives both as a message event and as an
+# app_mention event; remember recent message IDs so it is only answered once.
+_SEEN_MESSAGES_MAX = 1024
+_seen_messages = OrderedDict()
+_seen_messages_lock = threading.Lock()
+
+
+def _already_handled(message: Dict[str, Any]) -> bool:
+    """Record the message and return True if it was handled before"""
+    # (channel, ts) identifies a Slack message in both event payloads
+    key = (message.get("channel"), message.get("ts"))
+    with _seen_messages_lock:
+        if key in _seen_messages:
+            return True
+        _seen_messages[key] = None
+        if len(_seen_messages) > _SEEN_MESSAGES_MAX:
+            _seen_messages.popitem(last=False)
+    return False
+
+# MAX CHARACTERS OF TABLE ROWS PER BLOCK
+# Slack caps a section block at 3000 characters; leave room for the fences and footer.
+_TABLE_CHAR_BUDGET = 2800
+
+
+@lru_cache(maxsize=64)
+def _header_divider(columns: Tuple[str, ...]) -> Tuple[str, str]:
+    """Return the markdown header and divider rows for a set of columns"""
+    return (
+        "| " + " | ".join(columns) + " |",
+        "| " + " | ".join(["---"] * len(columns)) + " |"
+    )
+
+
+_CELL_MAX_CHARS = 50
+_ELLIPSIS = "..."
+_CELL_KEEP_CHARS = _CELL_MAX_CHARS - len(_ELLIPSIS)
+
+
+def _format_cell_uncached(cell: Any) -> str:
+    """Format a table cell as a string, truncating long values"""
+    if cell is None:
+        cell_str = ""
+    elif isinstance(cell, str):
+        # Genie returns most values pre-stringified
+        cell_str = cell
+    else:
+        cell_str = str(cell)
+    # Short cells (the common case) are returned as-is without slicing
+    if len(cell_str) <= _CELL_MAX_CHARS:
+        return cell_str
+    return cell_str[:_CELL_KEEP_CHARS] + _ELLIPSIS
+
+
+# Result tables repeat values (dates, statuses, IDs) across rows. typed=True
+# keeps equal-but-differently-typed keys such as 1 and 1.0 apart.
+_format_cell_cached = lru_cache(maxsize=4096, typed=True)(_format_cell_uncached)
+
+
+def _format_cell(cell: Any) -> str:
+    """Format a table cell, memoizing repeated hashable values"""
+    try:
+        return _format_cell_cached(cell)
+    except TypeError:
+        # Unhashable values (dicts, lists) are formatted directly
+        return _format_cell_uncached(cell)
+
+
+def _format_row(row: List[Any], ncols: int) -> str:
+    """Format a result row as a markdown table line of exactly ncols cells"""
+    # Ensure row length matches columns
+    if len(row) != ncols:
+        logger.warning("Row has %d cells but should have %d", len(row), ncols)
+        row = row[:ncols] if len(row) > ncols else list(row) + [""] * (ncols - len(row))
+    return f"| {' | '.join(_format_cell(cell) for cell in row)} |"
+
+
+def _result_csv(data: Dict[str, Any]) -> str:
+    """Render the full result table as CSV"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(data["columns"])
+    writer.writerows(row for row in data["rows"] if isinstance(row, (list, tuple)))
+    return buffer.getvalue()
+
+
 def format_dataframe_for_slack(data: Dict[str, Any]) -> List[Dict]:
     """Format a DataFrame as a Slack message with table"""
+    return _build_blocks(data)[0]
+
+
+def _build_blocks(data: Dict[str, Any]) -> Tuple[List[Dict], bool]:
+    """Build the Slack blocks for a result, and report whether its table was truncated"""
     blocks = []
+    truncated = False
     
     # Add query description if available
     if data.get("query_description"):
@@ -66,52 +280,40 @@ def format_dataframe_for_slack(data: Dict[str, Any]) -> List[Dict]:
     if data.get("columns") and data.get("rows") and FORMAT_TABLES:
         try:
             # Log table structure
-            logger.info(f"Creating table with {len(data['columns'])} columns and {len(data['rows'])} rows")
+            logger.info("Creating table with %d columns and %d rows", len(data["columns"]), len(data["rows"]))
 
+            # Only reuse cell strings within one table so the cache never pins old results
+            _format_cell_cached.cache_clear()
+            
             # Create header row
-            header_row = "| " + " | ".join(data["columns"]) + " |"
-            divider_row = "| " + " | ".join(["---"] * len(data["columns"])) + " |"
+            header_row, divider_row = _header_divider(tuple(data["columns"]))
     
-            # Create data rows
-            data_rows = []
-            for i, row in enumerate(data["rows"]):
-                # Ensure row is a list
-                if not isinstance(row, (list, tuple)):
-                    logger.warning(f"Row {i} is not a list or tuple: {type(row)}")
-                    continue
-                    
-                # Ensure row length matches columns
-                if len(row) != len(data["columns"]):
-                    logger.warning(f"Row {i} has {len(row)} cells but should have {len(data['columns'])}")
-                    row = row[:len(data["columns"])] if len(row) > len(data["columns"]) else row + [""] * (len(data["columns"]) - len(row))
-                
-                # Format each cell as string, handling potential None values
-                formatted_cells = []
-                for cell in row:
-                    cell_str = str(cell) if cell is not None else ""
-                    # Truncate long cell values
-                    if len(cell_str) > 50:
-                        cell_str = cell_str[:47] + "..."
-                    formatted_cells.append(cell_str)
-                
-                formatted_row = "| " + " | ".join(formatted_cells) + " |"
-                data_rows.append(formatted_row)
+            # Ensure every row is a list
+            ncols = len(data["columns"])
+            rows = [row for row in data["rows"] if isinstance(row, (list, tuple))]
+            if len(rows) != len(data["rows"]):
+                logger.warning("Skipping %d rows that are not lists or tuples", len(data["rows"]) - len(rows))
             
-            # Combine into a markdown table
-            markdown_table = header_row + "\n" + divider_row + "\n" + "\n".join(data_rows)
+            # Combine into a markdown table, stopping at the first row that would
+            # push it past Slack's block limit instead of formatting every row
+            table_head = f"{header_row}\n{divider_row}\n"
+            total = len(table_head)
+            kept_rows = []
+            for row in rows:
+                formatted_row = _format_row(row, ncols)
+                if total + len(formatted_row) + 1 > _TABLE_CHAR_BUDGET:
+                    break
+                kept_rows.append(formatted_row)
+                total += len(formatted_row) + 1
+            markdown_table = table_head + "\n".join(kept_rows)
             
-            # Check if table is too long for Slack (max 3000 chars in a single block)
-            if len(markdown_table) > 2900:  # Leave some buffer
-                logger.warning(f"Table is too large ({len(markdown_table)} chars), truncating")
-                # Truncate rows to fit
-                max_rows = min(10, len(data_rows))
-                truncated_table = header_row + "\n" + divider_row + "\n" + "\n".join(data_rows[:max_rows])
-                if max_rows < len(data_rows):
-                    truncated_table += f"\n\n_Showing {max_rows} of {len(data_rows)} rows_"
-                markdown_table = truncated_table
+            if len(kept_rows) < len(rows):
+                truncated = True
+                logger.warning("Table is too large for one block, showing %d of %d rows", len(kept_rows), len(rows))
+                markdown_table += f"\n\n_Showing {len(kept_rows)} of {len(rows)} rows_"
             
             # Add to blocks
-            logger.info(f"Adding table block with {len(markdown_table)} characters")
+            logger.info("Adding table block with %d characters", len(markdown_table))
             blocks.append({
                 "type": "section",
                 "text": {
@@ -120,7 +322,7 @@ def format_dataframe_for_slack(data: Dict[str, Any]) -> List[Dict]:
                 }
             })
         except Exception as e:
-            logger.error(f"Error formatting table: {str(e)}")
+            logger.exception("Error formatting table")
             blocks.append({
                 "type": "section",
                 "text": {
@@ -128,6 +330,8 @@ def format_dataframe_for_slack(data: Dict[str, Any]) -> List[Dict]:
                     "text": f"Error formatting table: {str(e)}"
                 }
             })
+        finally:
+            _format_cell_cached.cache_clear()
     
     # If we have no blocks, add a simple message
     if not blocks:
@@ -140,7 +344,7 @@ def format_dataframe_for_slack(data: Dict[str, Any]) -> List[Dict]:
             }
         })
     
-    return blocks
+    return blocks, truncated
 
 
 @app.event("message")
@@ -150,44 +354,31 @@ def handle_message_events(body, logger):
     
     # Handle bot being added to a channel
     if event.get("subtype") == "bot_add":
-        logger.info(f"Bot was added to channel: {event.get('channel')}")
+        logger.info("Bot was added to channel: %s", event.get("channel"))
         return
     
     # If it's a regular message, process it through the message handler
     if event.get("type") == "message" and not event.get("subtype"):
-        # Create a simplified message object for the handler
-        message = {
-            "text": event.get("text", ""),
-            "user": event.get("user"),
-            "channel": event.get("channel"),
-            "ts": event.get("ts"),
-            "thread_ts": event.get("thread_ts"),
-            "channel_type": event.get("channel_type")
-        }
-        
-        # Create a say function that uses the app client properly
-        def say(msg_params):
-            return app.client.chat_postMessage(**{
-                "channel": message["channel"],
-                **msg_params
-            })
-        
-        # Process through the regular message handler
-        handle_message(message, say)
+        # Process the event through the regular message handler, posting via the rate limiter
+        handle_message(event, _make_say(event.get("channel")))
     else:
-        logger.info(f"Received message event: {body}")
+        logger.debug("Received message event: %s", body)
 
-@app.message(re.compile(".*"))
 def handle_message(message, say):
     """Handle any message in the channel or DM"""
     # Log the full message for debugging
-    logger.info(f"Received Slack message: {message}")
+    logger.debug("Received Slack message: %s", message)
     
     # Ignore messages from bots to prevent loops
     if message.get("bot_id"):
         logger.info("Ignoring message from bot")
         return
     
+    # Ignore the second delivery of the same message (message + app_mention)
+    if _already_handled(message):
+        logger.info("Ignoring already handled message")
+        return
+    
     # Get the message text and user ID
     text = message.get("text", "").strip()
     user_id = message.get("user", "unknown_user")
@@ -199,47 +390,70 @@ def handle_message(message, say):
         return
     
     # Allow messages from either:
-    # 1. The configured channel
+    # 1. One of the configured channels
     # 2. Direct messages (im)
-    if message.get("channel") != SLACK_CHANNEL_ID and channel_type != "im":
-        logger.info(f"Ignoring message from channel {message.get('channel')} (not {SLACK_CHANNEL_ID} or DM)")
+    if message.get("channel") not in SLACK_CHANNEL_IDS and channel_type != "im":
+        logger.info("Ignoring message from channel %s (not %s or DM)", message.get("channel"), SLACK_CHANNEL_ID)
         return
     
-    logger.info(f"Processing message: '{text}' from user: {user_id}")
-    
-    # Let the user know we're processing their query
-    say({
-        "text": f"Processing your query: '{text}'...",
-        "thread_ts": message.get("ts")
-    })
+    logger.info("Processing message: %r from user: %s", text, user_id)
+    thread_ts = message.get("ts")
     
     try:
-        logger.info(f"Querying Databricks Genie with question from user {user_id}: '{text}'")
+        logger.info("Querying Databricks Genie with question from user %s: %r", user_id, text)
         
-        # Query Databricks Genie with the user's question
-        result = genie_query(user_id, text)
+        # Query Databricks Genie on the worker pool so this handler returns
+        # promptly, and only let the user know we're processing the question
+        # if the answer doesn't come back quickly
+        future = _submit_for_user(user_id, genie_query, user_id, text)
+        done, _ = wait([future], timeout=_ACK_DELAY)
+        if not done:
+            say({
+                "text": f"Processing your query: '{text}'...",
+                "thread_ts": thread_ts
+            })
+    except Exception as e:
+        logger.exception("Error processing message")
+        # Send error message
+        say({
+            "text": f"Sorry, I encountered an error: {str(e)}",
+            "thread_ts": thread_ts
+        })
+        return
+    
+    # Post the answer from whichever thread finishes the query
+    future.add_done_callback(lambda f: _send_result(f, say, message.get("channel"), thread_ts))
+
+
+def _send_result(future: Future, say: Callable[[Dict[str, Any]], Any], channel: str, thread_ts: str):
+    """Post a finished Genie query result (or its error) to the message thread"""
+    try:
+        result = future.result()
         
-        logger.info(f"Received response from Databricks Genie: conversation_id={result.get('conversation_id')}, message_id={result.get('message_id')}")
+        logger.info("Received response from Databricks Genie: conversation_id=%s, message_id=%s", result.get("conversation_id"), result.get("message_id"))
         
         # Check if there was an error
         if "error" in result:
             error_message = result.get("error", "Unknown error occurred")
-            logger.error(f"Error from Databricks Genie: {error_message}")
+            logger.error("Error from Databricks Genie: %s", error_message)
             # Send error message
             say({
                 "text": f"Sorry, I encountered an error: {error_message}",
-                "thread_ts": message.get("ts")
+                "thread_ts": thread_ts
             })
             return
         
         # Format the results for Slack
         formatted_result = result.get("result", {})
-        logger.info(f"Raw result: {result}")  # Print the entire result object
-        logger.info(f"Formatting result for Slack: text={len(formatted_result.get('text', ''))}, has_data={bool(formatted_result.get('rows'))}")
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Raw result: %s", result)  # Print the entire result object
+        logger.info("Formatting result for Slack: text=%d, has_data=%s", len(formatted_result.get("text", "")), bool(formatted_result.get("rows")))
         
-        blocks = format_dataframe_for_slack(formatted_result)
-        logger.info(f"Generated {len(blocks)} blocks for Slack message")
-        logger.info(f"Blocks content: {blocks}")  # Print the blocks for debugging
+        # A table too large for one block is shown truncated, with the full results uploaded as CSV
+        blocks, upload_csv = _build_blocks(formatted_result)
+        logger.info("Generated %d blocks for Slack message", len(blocks))
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug("Blocks content: %s", blocks)  # Print the blocks for debugging
         
         # Send the response
         logger.info("Sending results to Slack")
@@ -252,31 +466,62 @@ def handle_message(message, say):
         response = say({
             "blocks": blocks,
             "text": response_text,
-            "thread_ts": message.get("ts")
+            "thread_ts": thread_ts
         })
-        logger.info(f"Slack response: {response}")  # Log the Slack API response
-        logger.info(f"Sent response to Slack, thread: {message.get('ts')}")
+        logger.debug("Slack response: %s", response)  # Log the Slack API response
+        logger.info("Sent response to Slack, thread: %s", thread_ts)
+        
+        if upload_csv:
+            _upload_result_csv(formatted_result, say, channel, thread_ts)
         
     except Exception as e:
-        logger.error(f"Error processing message: {str(e)}")
+        logger.exception("Error processing message")
         # Send error message
-        say({
-            "text": f"Sorry, I encountered an error: {str(e)}",
-            "thread_ts": message.get("ts")
-        })
+        try:
+            say({
+                "text": f"Sorry, I encountered an error: {str(e)}",
+                "thread_ts": thread_ts
+            })
+        except Exception:
+            logger.exception("Could not send error message to Slack")
+
+def _upload_result_csv(data: Dict[str, Any], say: Callable[[Dict[str, Any]], Any], channel: str, thread_ts: str):
+    """Upload the full result table to the thread as a CSV file"""
+    try:
+        _post_limiter.acquire(channel)
+        app.client.files_upload_v2(
+            channel=channel,
+            thread_ts=thread_ts,
+            content=_result_csv(data),
+            filename="result.csv",
+            title="Query results",
+            initial_comment=f"Full results ({len(data['rows'])} rows) attached as CSV."
+        )
+        logger.info("Uploaded %d result rows as CSV, thread: %s", len(data["rows"]), thread_ts)
+    except Exception:
+        # e.g. the app lacks the files:write scope; the truncated table is already posted
+        logger.exception("Could not upload results as CSV")
+        try:
+            say({
+                "text": "_The full results could not be attached as a CSV file._",
+                "thread_ts": thread_ts
+            })
+        except Exception:
+            logger.exception("Could not send upload failure notice to Slack")
 
 # Handle app_mention events (when someone @mentions the bot)
 @app.event("app_mention")
-def handle_mentions(body, say):
+def handle_mentions(body):
     """Handle when users mention the bot"""
     event = body.get("event", {})
     channel = event.get("channel")
+    say = _make_say(channel)
     user = event.get("user")
     text = event.get("text", "").strip()
     
     # Remove the bot mention from the text
     # This assumes the mention is at the start of the message
-    text = re.sub(r"<@[^>]+>\s*", "", text).strip()
+    text = _MENTION_RE.sub("", text).strip()
     
     if text:
         # Process the message like a regular query
@@ -287,6 +532,9 @@ def handle_mentions(body, say):
             "thread_ts": event.get("ts")
         })
 
+# SINGLE FLASK REQUEST HANDLER SHARED BY ALL REQUESTS
+_handler = SlackRequestHandler(app)
+
 def get_handler() -> SlackRequestHandler:
     """Returns the SlackRequestHandler for use with Flask"""
-    return SlackRequestHandler(app)
\ No newline at end of file
+    return _handler
\ No newline at end of file
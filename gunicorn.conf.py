@@ -0,0 +1,26 @@
+"""
+Gunicorn configuration for the Databricks Genie Slack Bot.
+"""
+import os
+
+# BIND TO THE SAME PORT app.main() WOULD USE
+bind = f"0.0.0.0:{os.getenv('PORT', '3000')}"
+
+# THREADED WORKERS
+# Requests spend almost all their time waiting on Slack and Databricks, so
+# threads are far cheaper than processes here. Keep a single worker process
+# by default so conversation contexts are shared by every request.
+worker_class = "gthread"
+workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+threads = int(os.getenv("GUNICORN_THREADS", "32"))
+
+# Genie queries are polled inside the request, so allow for the full poll budget
+timeout = int(os.getenv("GUNICORN_TIMEOUT", "120"))
+
+
+def on_starting(server):
+    """Print and validate the configuration once before any worker starts"""
+    from databricks_genie_bot.config import print_config_status, validate_config
+
+    print_config_status()
+    validate_config()
@@ -21,6 +21,6 @@ source venv/bin/activate
 echo "Installing dependencies..."
 pip install -r requirements.txt
 
-# Run the application
+# Run the application under gunicorn (see gunicorn.conf.py)
 echo "Starting Databricks Genie Slack Bot..."
-python app.py
\ No newline at end of file
+exec gunicorn app:app
\ No newline at end of file
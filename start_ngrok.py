@@ -15,65 +15,55 @@ Where <PORT> is the port your Flask app is running on (default: 3000)
 """
 import os
 import sys
-import time
+import threading
 import requests
 from dotenv import load_dotenv
 
 # Load environment variables
 load_dotenv()
 
-def check_ngrok_running():
-    """Check if ngrok is running"""
-    try:
-        response = requests.get("http://localhost:4040/api/tunnels", timeout=2)
-        if response.status_code == 200:
-            return True
-        return False
-    except requests.exceptions.RequestException:
-        return False
+# NGROK LOCAL API ENDPOINT LISTING ACTIVE TUNNELS
+NGROK_API_URL = "http://localhost:4040/api/tunnels"
+
+# Shared session so repeated API calls reuse one keep-alive connection
+_SESSION = requests.Session()
 
 def get_ngrok_url():
-    """Get the public URL from ngrok"""
+    """Get the public URL from ngrok, or None if ngrok isn't running or has no tunnels"""
     try:
-        response = requests.get("http://localhost:4040/api/tunnels")
-        tunnels = response.json()["tunnels"]
-        
-        if not tunnels:
-            print("No tunnels found. Please check ngrok is running properly.")
-            return None
-        
-        # Get the HTTPS tunnel URL
-        for tunnel in tunnels:
-            if tunnel["proto"] == "https":
-                public_url = tunnel["public_url"]
-                print(f"\n✅ ngrok tunnel is active at: {public_url}")
-                return public_url
-        
-        # If no HTTPS tunnel found, use the first tunnel
-        public_url = tunnels[0]["public_url"]
-        print(f"\n✅ ngrok tunnel is active at: {public_url}")
-        return public_url
-        
-    except requests.exceptions.RequestException:
-        print("Could not connect to ngrok API. Please check it's running correctly.")
+        response = _SESSION.get(NGROK_API_URL, timeout=2)
+        response.raise_for_status()
+        tunnels = response.json().get("tunnels") or []
+    except (requests.exceptions.RequestException, ValueError):
+        return None
+    
+    if not tunnels:
+        print("No tunnels found. Please check ngrok is running properly.")
         return None
+    
+    # Get the HTTPS tunnel URL
+    for tunnel in tunnels:
+        if tunnel["proto"] == "https":
+            public_url = tunnel["public_url"]
+            print(f"\n✅ ngrok tunnel is active at: {public_url}")
+            return public_url
+    
+    # If no HTTPS tunnel found, use the first tunnel
+    public_url = tunnels[0]["public_url"]
+    print(f"\n✅ ngrok tunnel is active at: {public_url}")
+    return public_url
 
 def main():
     # Get the port from environment or use default
     port = int(os.environ.get("PORT", 3000))
     
-    # Check if ngrok is running
-    if not check_ngrok_running():
-        print("❌ ngrok is not running. Please start ngrok first with:")
-        print(f"    ngrok http {port}")
-        print("\nThen run this script again.")
-        sys.exit(1)
-    
-    # Get the ngrok URL
+    # Check ngrok is running and get its URL in a single API call
     public_url = get_ngrok_url()
     
     if not public_url:
-        print("❌ Could not get ngrok tunnel URL.")
+        print("❌ Could not get an ngrok tunnel URL. Please start ngrok first with:")
+        print(f"    ngrok http {port}")
+        print("\nThen run this script again.")
         sys.exit(1)
     
     # Print instructions for Slack
@@ -93,8 +83,7 @@ def main():
     # Keep script running until interrupted
     print("\n(Press Ctrl+C to exit this script - ngrok will continue running)")
     try:
-        while True:
-            time.sleep(60)
+        threading.Event().wait()
     except KeyboardInterrupt:
         print("\nExiting script. Remember to manually stop ngrok when done.")
         sys.exit(0)
@@ -3,8 +3,9 @@
 Test the Slack token to verify it can make API calls.
 This will help diagnose the 'not_allowed_token_type' error.
 """
+import argparse
 import os
-import sys
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 from slack_sdk import WebClient
 from slack_sdk.errors import SlackApiError
@@ -12,7 +13,15 @@ from slack_sdk.errors import SlackApiError
 # Load environment variables from .env file
 load_dotenv()
 
-def test_token(token=None):
+def list_channels(client):
+    """Return up to five channel names, or the Slack error if listing is not allowed"""
+    try:
+        channels = client.conversations_list(limit=5)
+        return [c["name"] for c in channels.get("channels", [])], None
+    except SlackApiError as e:
+        return None, e.response['error']
+
+def test_token(token=None, verbose=False):
     """Test if a Slack token is valid and has appropriate permissions"""
     # Use provided token or get from environment
     if not token:
@@ -29,40 +38,48 @@ def test_token(token=None):
     print(f"Token starts with 'xoxb': {token.startswith('xoxb')}")
     
     # Try to use the token
-    client = WebClient(token=token)
-    try:
-        # Try to get bot info
-        resp = client.auth_test()
+    client = WebClient(token=token, timeout=5)
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        # Channel listing is diagnostic only; in verbose mode it runs alongside auth.test
+        channels_future = executor.submit(list_channels, client) if verbose else None
+        try:
+            # Try to get bot info
+            resp = client.auth_test()
+        except SlackApiError as e:
+            report_auth_error(e)
+            return False
+        
         print("\nSUCCESS! Token is valid.")
         print(f"Connected as: {resp.get('user')} (ID: {resp.get('user_id')})")
         print(f"Team: {resp.get('team')} (ID: {resp.get('team_id')})")
         print(f"Bot ID: {resp.get('bot_id', 'N/A')}")
         
         # Try to list channels (requires different permissions)
-        try:
-            channels = client.conversations_list(limit=5)
-            channel_names = [c["name"] for c in channels.get("channels", [])]
-            print(f"\nCan see channels: {', '.join(channel_names[:5])}")
-        except SlackApiError as e:
-            print(f"\nCannot list channels: {e.response['error']}")
-        
-        return True
-        
-    except SlackApiError as e:
-        print("\nERROR: Token is invalid or doesn't have required permissions")
-        print(f"Error: {e.response['error']}")
-        
-        if e.response['error'] == 'not_allowed_token_type':
-            print("\nCOMMON FIX FOR 'not_allowed_token_type' ERROR:")
-            print("1. You must use a Bot User OAuth Token (starts with xoxb-)")
-            print("2. Go to your Slack App settings: https://api.slack.com/apps")
-            print("3. Click on your app, then select 'OAuth & Permissions'")
-            print("4. Find 'Bot User OAuth Token' (not 'User OAuth Token')")
-            print("5. Copy this token to your .env file as SLACK_BOT_TOKEN\n")
-            
-        return False
+        if channels_future:
+            channel_names, error = channels_future.result()
+            if error:
+                print(f"\nCannot list channels: {error}")
+            else:
+                print(f"\nCan see channels: {', '.join(channel_names[:5])}")
+    
+    return True
+
+def report_auth_error(e):
+    """Explain why auth.test rejected the token"""
+    print("\nERROR: Token is invalid or doesn't have required permissions")
+    print(f"Error: {e.response['error']}")
+    
+    if e.response['error'] == 'not_allowed_token_type':
+        print("\nCOMMON FIX FOR 'not_allowed_token_type' ERROR:")
+        print("1. You must use a Bot User OAuth Token (starts with xoxb-)")
+        print("2. Go to your Slack App settings: https://api.slack.com/apps")
+        print("3. Click on your app, then select 'OAuth & Permissions'")
+        print("4. Find 'Bot User OAuth Token' (not 'User OAuth Token')")
+        print("5. Copy this token to your .env file as SLACK_BOT_TOKEN\n")
 
 if __name__ == "__main__":
-    # Get token from command line if provided
-    token = sys.argv[1] if len(sys.argv) > 1 else None
-    test_token(token)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Test a Slack bot token")
+    parser.add_argument("token", nargs="?", help="Token to test (defaults to SLACK_BOT_TOKEN)")
+    parser.add_argument("--verbose", action="store_true", help="Also check which channels the token can list")
+    args = parser.parse_args()
+    test_token(args.token, verbose=args.verbose)
@@ -0,0 +1,98 @@
+"""
+Tests for streaming query results from the Databricks Genie API.
+"""
+import threading
+import time
+import unittest
+from unittest import mock
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from databricks_genie_bot import databricks_utils
+
+
+class _BrokenBodyHandler(BaseHTTPRequestHandler):
+    """Sends a query-result response whose body stalls or is cut short"""
+
+    def do_GET(self):
+        body = b'{"statement_response": {"status": {"state": "SUCCEEDED"}, "result": {"data_typed_array": ['
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body) + 100))
+        self.end_headers()
+        self.wfile.write(body)
+        self.wfile.flush()
+        if self.path.endswith("/stall/query-result"):
+            # Keep the connection open past the client's read timeout
+            time.sleep(2)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class QueryResultStreamTest(unittest.TestCase):
+    """Errors while reading a streamed query result surface as requests exceptions"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), _BrokenBodyHandler)
+        cls.server.daemon_threads = True
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.host = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self._timeout = databricks_utils._TIMEOUT
+        self._breaker = databricks_utils._BREAKER
+        databricks_utils._TIMEOUT = (1, 0.5)
+        databricks_utils._BREAKER = databricks_utils.CircuitBreaker(fail_max=2, reset_timeout=60)
+
+    def tearDown(self):
+        databricks_utils._TIMEOUT = self._timeout
+        databricks_utils._BREAKER = self._breaker
+
+    def test_stalled_body_raises_connection_error(self):
+        with self.assertRaises(requests.exceptions.ConnectionError):
+            databricks_utils.get_query_results("space", "conversation", "stall", "token", self.host)
+
+    def test_truncated_body_raises_request_exception(self):
+        with self.assertRaises(requests.exceptions.RequestException):
+            databricks_utils.get_query_results("space", "conversation", "truncated", "token", self.host)
+
+    def test_broken_bodies_open_the_breaker(self):
+        for _ in range(2):
+            with self.assertRaises(requests.exceptions.RequestException):
+                databricks_utils.get_query_results("space", "conversation", "truncated", "token", self.host)
+        with self.assertRaises(databricks_utils.CircuitOpenError):
+            databricks_utils.get_query_results("space", "conversation", "truncated", "token", self.host)
+
+
+class QueryDataRetryTest(unittest.TestCase):
+    """query_data keeps polling when a query-result download breaks off"""
+
+    def test_broken_result_download_is_retried(self):
+        message = {"status": "COMPLETED", "attachments": [{"query": {"description": "d", "query": "select 1"}}]}
+        result = {
+            "statement_response": {
+                "status": {"state": "SUCCEEDED"},
+                "manifest": {"schema": {"columns": [{"name": "x"}]}},
+                "result": {"data_typed_array": [["42"]]}
+            }
+        }
+        with mock.patch.object(databricks_utils, "start_conversation", return_value=("c", "m")), \
+                mock.patch.object(databricks_utils, "get_query_message", return_value=message), \
+                mock.patch.object(databricks_utils, "get_query_results", side_effect=[
+                    requests.exceptions.ChunkedEncodingError("connection reset"), result
+                ]):
+            response = databricks_utils.query_data("space", "question", "token", "host", retry_base=0, retry_cap=0)
+        self.assertNotIn("error", response)
+        self.assertEqual(response["result"]["rows"], [["42"]])
+
+
+if __name__ == "__main__":
+    unittest.main()